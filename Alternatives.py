@@ -0,0 +1,135 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import networkx as nx
+
+from Network import edge_cost, snap_node
+
+
+class AlternativeRoute(NamedTuple):
+    path: List[Tuple]
+    total_length: float  # km, as returned by calculate_shortest_safest_path
+    cost: float  # sum of the routing weight along the path
+    penalized_cost: float  # cost with avoid_penalty applied, equal to cost when nothing is avoided
+    stretch: float  # penalized cost relative to the best route, 0.0 for the best route itself
+    overlap: float  # largest share of the penalized cost shared with a previously returned route
+
+
+def _tree_path(pred: Dict, node: Tuple) -> List[Tuple]:
+    """Follow a shortest-path tree from node back to its root"""
+    path = [node]
+    while pred[path[-1]]:
+        path.append(pred[path[-1]][0])
+    return path
+
+
+def _path_cost(graph: nx.Graph, path: List[Tuple], weight: str) -> float:
+    return float(sum(edge_cost(graph.edges[edge], weight) for edge in zip(path, path[1:])))
+
+
+def calculate_alternative_paths(
+    graph: nx.Graph,
+    start_node: Tuple,
+    end_node: Tuple,
+    k: int = 3,
+    max_stretch: float = 0.25,
+    max_overlap: float = 0.6,
+    weight: str = "weight",
+    avoid_categories: Optional[Iterable[str]] = None,
+    avoid_penalty: float = 3.0,
+) -> List[AlternativeRoute]:
+    """Return up to k meaningfully different routes using the plateau method.
+
+    One forward search from the start and one backward search from the end are shared by all
+    alternatives: every plateau (a chain of edges both shortest-path trees agree on) yields a locally
+    optimal via route. Candidates are accepted best cost first while their cost stays within
+    ``max_stretch`` of the best route and they share at most ``max_overlap`` of their cost with any route
+    already accepted. Edges in ``avoid_categories`` are weighted ``avoid_penalty`` times heavier, e.g. to
+    steer the alternatives away from "shared with cars" segments.
+    """
+    start_node = snap_node(graph, start_node)
+    end_node = snap_node(graph, end_node)
+
+    avoid: Set[str] = set(avoid_categories or ())
+
+    def cost(u, v, edge_data):
+        if edge_data.get("category") in avoid:
+            return edge_cost(edge_data, weight) * avoid_penalty
+        return edge_cost(edge_data, weight)
+
+    forward_pred, forward_dist = nx.dijkstra_predecessor_and_distance(graph, start_node, weight=cost)
+    if end_node not in forward_dist:
+        return []
+    backward_pred, backward_dist = nx.dijkstra_predecessor_and_distance(graph, end_node, weight=cost)
+
+    # Label every node on a plateau with the plateau it belongs to, walking the forward tree in settle order
+    plateau_of: Dict[Tuple, int] = {}
+    plateau_via: List[Tuple] = []
+    plateau_length: List[float] = []
+    for node in forward_dist:
+        if not forward_pred[node] or node not in backward_dist:
+            continue
+        parent = forward_pred[node][0]
+        if not backward_pred[parent] or backward_pred[parent][0] != node:
+            continue
+        if parent not in plateau_of:
+            plateau_of[parent] = len(plateau_via)
+            plateau_via.append(parent)
+            plateau_length.append(0.0)
+        plateau = plateau_of[parent]
+        plateau_of[node] = plateau
+        plateau_length[plateau] += forward_dist[node] - forward_dist[parent]
+
+    best_cost = forward_dist[end_node]
+    candidates = sorted(
+        range(len(plateau_via)),
+        key=lambda p: (forward_dist[plateau_via[p]] + backward_dist[plateau_via[p]], -plateau_length[p]),
+    )
+    if not candidates:
+        path = _tree_path(forward_pred, end_node)[::-1]
+        total_length = float(sum(graph.edges[edge]["distance"] for edge in zip(path, path[1:]))) / 1000
+        return [AlternativeRoute(path, total_length, _path_cost(graph, path, weight), float(best_cost), 0.0, 0.0)]
+
+    routes: List[AlternativeRoute] = []
+    accepted_edges: List[Dict[frozenset, float]] = []
+    for plateau in candidates:
+        via = plateau_via[plateau]
+        route_cost = forward_dist[via] + backward_dist[via]
+        stretch = max(route_cost / best_cost - 1, 0.0) if best_cost else 0.0
+        if stretch > max_stretch:
+            break
+
+        path = _tree_path(forward_pred, via)[::-1] + _tree_path(backward_pred, via)[1:]
+        if len(set(path)) < len(path):
+            continue
+        edges = {frozenset(edge): cost(*edge, graph.edges[edge]) for edge in zip(path, path[1:])}
+        overlap = max(
+            (sum(c for edge, c in edges.items() if edge in other) / route_cost for other in accepted_edges),
+            default=0.0,
+        )
+        if overlap > max_overlap:
+            continue
+
+        total_length = float(sum(graph.edges[edge]["distance"] for edge in zip(path, path[1:]))) / 1000
+        routes.append(
+            AlternativeRoute(path, total_length, _path_cost(graph, path, weight), route_cost, stretch, overlap)
+        )
+        accepted_edges.append(edges)
+        if len(routes) >= k:
+            break
+
+    return routes
+
+
+if __name__ == "__main__":
+    from Network import read_graph
+
+    start_node = (361750.487, 5620104.35012)
+    end_node = (366342.797, 5621616.124)
+
+    graph = read_graph(1)
+    for route in calculate_alternative_paths(graph, start_node, end_node, avoid_categories=["shared with cars"]):
+        print(
+            "Total length: {:.2f} km, stretch {:.0%}, overlap {:.0%}".format(
+                route.total_length, route.stretch, route.overlap
+            )
+        )
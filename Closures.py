@@ -0,0 +1,203 @@
+import heapq
+import weakref
+from typing import Dict, List, Optional, Set, Tuple
+
+import networkx as nx
+
+from Network import edge_cost
+
+# Shortest-path trees to repair per graph. Kept off graph.graph so graphs stay picklable
+_trees: "weakref.WeakKeyDictionary[nx.Graph, weakref.WeakSet]" = weakref.WeakKeyDictionary()
+
+
+def _edge_key(u: Tuple, v: Tuple) -> frozenset:
+    return frozenset((u, v))
+
+
+def _record(graph: nx.Graph, action: str, u: Tuple, v: Tuple) -> int:
+    """Bump the graph and edge versions, log the change and repair the registered shortest-path trees"""
+    graph.graph["version"] = graph.graph.get("version", 0) + 1
+    # Station status updates only bump version, edge_version tracks changes of the edges alone
+    graph.graph["edge_version"] = graph.graph.get("edge_version", 0) + 1
+    graph.graph.setdefault("overlay_log", []).append((graph.graph["version"], action, u, v))
+    for tree in list(_trees.get(graph, ())):
+        tree.edge_changed(u, v)
+    # Keep the segment index of SegmentIndex.get_segment_index in step, or drop it to be rebuilt
+    index = graph.graph.get("segmentIndex")
+    if index is not None and not index.edge_changed(graph, u, v):
+        del graph.graph["segmentIndex"]
+    return graph.graph["version"]
+
+
+def _keep_baseline(graph: nx.Graph, u: Tuple, v: Tuple) -> None:
+    """Remember the read_graph attributes of an edge before its first change"""
+    overlay = graph.graph.setdefault("overlay", {})
+    key = _edge_key(u, v)
+    if key not in overlay:
+        overlay[key] = (u, v, dict(graph.edges[u, v]) if graph.has_edge(u, v) else None)
+
+
+def close_edge(graph: nx.Graph, u: Tuple, v: Tuple) -> int:
+    """Close an edge, e.g. for road works. Returns the new graph version"""
+    if not graph.has_edge(u, v):
+        raise KeyError(f"No edge between {u} and {v}")
+    _keep_baseline(graph, u, v)
+    graph.remove_edge(u, v)
+    return _record(graph, "close", u, v)
+
+
+def reopen_edge(graph: nx.Graph, u: Tuple, v: Tuple) -> int:
+    """Reopen a closed edge with its baseline attributes. Returns the new graph version"""
+    overlay = graph.graph.get("overlay", {})
+    key = _edge_key(u, v)
+    # A reweighted edge has a baseline as well, reopening must not silently undo the reweighting
+    if graph.has_edge(u, v) or key not in overlay or overlay[key][2] is None:
+        raise KeyError(f"Edge between {u} and {v} is not closed")
+    _, _, baseline = overlay.pop(key)
+    graph.add_edge(u, v, **baseline)
+    return _record(graph, "reopen", u, v)
+
+
+def reweight_edge(graph: nx.Graph, u: Tuple, v: Tuple, **attributes) -> int:
+    """Override edge attributes such as weight or safety. Returns the new graph version"""
+    if not graph.has_edge(u, v):
+        raise KeyError(f"No edge between {u} and {v}")
+    _keep_baseline(graph, u, v)
+    graph.edges[u, v].update(attributes)
+    return _record(graph, "reweight", u, v)
+
+
+def reset_overlay(graph: nx.Graph) -> int:
+    """Undo every closure and reweighting since read_graph. Returns the new graph version"""
+    overlay = graph.graph.get("overlay", {})
+    for u, v, baseline in list(overlay.values()):
+        if graph.has_edge(u, v):
+            graph.edges[u, v].clear()
+        graph.add_edge(u, v, **baseline)
+        del overlay[_edge_key(u, v)]
+        _record(graph, "reset", u, v)
+    return graph.graph.get("version", 0)
+
+
+class ShortestPathTree:
+    """Single-source shortest-path tree that stays valid while edges are closed, reopened or reweighted.
+
+    The tree registers itself on the graph and is repaired on every change: a weight decrease is
+    propagated from the improved node, a weight increase on a tree edge only re-settles the subtree
+    hanging off that edge. Changes off the tree that do not shorten anything cost O(1).
+    """
+
+    def __init__(self, graph: nx.Graph, source: Tuple, weight: str = "weight"):
+        self.graph = graph
+        self.source = source
+        self.weight = weight
+        self.dist: Dict[Tuple, float] = {}
+        self.pred: Dict[Tuple, Optional[Tuple]] = {}
+        self.children: Dict[Tuple, Set[Tuple]] = {}
+        self._settle([(0.0, source, None)])
+        self.version = graph.graph.get("version", 0)
+        _trees.setdefault(graph, weakref.WeakSet()).add(self)
+
+    def _edge_weight(self, u: Tuple, v: Tuple) -> float:
+        edge_data = self.graph[u].get(v)
+        if edge_data is None:
+            return float("inf")
+        return edge_cost(edge_data, self.weight)
+
+    def _set_parent(self, node: Tuple, parent: Optional[Tuple]) -> None:
+        old_parent = self.pred.get(node)
+        if old_parent is not None:
+            self.children[old_parent].discard(node)
+        self.pred[node] = parent
+        self.children.setdefault(node, set())
+        if parent is not None:
+            self.children[parent].add(node)
+
+    def _settle(self, queue: List) -> None:
+        heapq.heapify(queue)
+        inf = float("inf")
+        while queue:
+            d, node, parent = heapq.heappop(queue)
+            if d >= self.dist.get(node, inf):
+                continue
+            self.dist[node] = d
+            self._set_parent(node, parent)
+            for neighbor, edge_data in self.graph[node].items():
+                next_d = d + edge_cost(edge_data, self.weight)
+                if next_d < self.dist.get(neighbor, inf):
+                    heapq.heappush(queue, (next_d, neighbor, node))
+
+    def _subtree(self, root: Tuple) -> Set[Tuple]:
+        subtree, stack = {root}, [root]
+        while stack:
+            for child in self.children.get(stack.pop(), ()):
+                subtree.add(child)
+                stack.append(child)
+        return subtree
+
+    def edge_changed(self, u: Tuple, v: Tuple) -> None:
+        inf = float("inf")
+        w = self._edge_weight(u, v)
+        queue = []
+        invalidated: Set[Tuple] = set()
+        for a, b in ((u, v), (v, u)):
+            if a not in self.dist:
+                continue
+            if self.pred.get(b) == a and self.dist[a] + w > self.dist[b]:
+                # The tree edge got longer: invalidate the subtree and re-seed it from its intact border
+                affected = self._subtree(b)
+                invalidated |= affected
+                for node in affected:
+                    self._set_parent(node, None)
+                    del self.dist[node]
+                for node in affected:
+                    best = (inf, node, None)
+                    for neighbor in self.graph[node]:
+                        if neighbor in self.dist:
+                            candidate = self.dist[neighbor] + self._edge_weight(neighbor, node)
+                            if candidate < best[0]:
+                                best = (candidate, node, neighbor)
+                    if best[0] < inf:
+                        queue.append(best)
+            elif self.dist[a] + w < self.dist.get(b, inf):
+                queue.append((self.dist[a] + w, b, a))
+        self._settle(queue)
+        for node in invalidated:
+            if node not in self.dist:
+                # Cut off from the source by the change
+                del self.pred[node]
+                del self.children[node]
+        self.version = self.graph.graph.get("version", 0)
+
+    def distance_to(self, target: Tuple) -> float:
+        return self.dist.get(target, float("inf"))
+
+    def path_to(self, target: Tuple) -> List[Tuple]:
+        """Return the current shortest path from the source to target, or [] if it is unreachable"""
+        if target not in self.dist:
+            return []
+        path = [target]
+        while self.pred[path[-1]] is not None:
+            path.append(self.pred[path[-1]])
+        return path[::-1]
+
+
+if __name__ == "__main__":
+    import time
+
+    from Network import read_graph, snap_node
+
+    graph = read_graph(1)
+    start_node = snap_node(graph, (361750.487, 5620104.35012))
+    end_node = snap_node(graph, (366342.797, 5621616.124))
+
+    tree = ShortestPathTree(graph, start_node)
+    path = tree.path_to(end_node)
+    print("Before closure:", tree.distance_to(end_node))
+
+    t0 = time.perf_counter()
+    close_edge(graph, path[len(path) // 2], path[len(path) // 2 + 1])
+    print("After closure:", tree.distance_to(end_node), f"({(time.perf_counter() - t0) * 1000:.1f} ms)")
+
+    reset_overlay(graph)
+    print("After reset:", tree.distance_to(end_node), "version", graph.graph["version"])
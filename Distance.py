@@ -0,0 +1,72 @@
+from typing import Optional
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # mean earth radius in metres
+
+
+def planar_distance(a, b) -> np.ndarray:
+    """Row-wise distance in metres between two (n, 2) arrays of UTM coordinates"""
+    delta = np.asarray(a, dtype=float) - np.asarray(b, dtype=float)
+    return np.hypot(delta[..., 0], delta[..., 1])
+
+
+def planar_one_to_many(point, points) -> np.ndarray:
+    """Distance in metres from one UTM point to each row of an (n, 2) array"""
+    return planar_distance(np.asarray(points, dtype=float), np.asarray(point, dtype=float)[None, :])
+
+
+def planar_pairwise(a, b) -> np.ndarray:
+    """(n, m) matrix of distances in metres between UTM point sets a and b"""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return planar_distance(a[:, None, :], b[None, :, :])
+
+
+def segment_lengths(coordinates) -> np.ndarray:
+    """Length in metres of every segment of a UTM polyline given as an (n, 2) array"""
+    coordinates = np.asarray(coordinates, dtype=float)
+    return planar_distance(coordinates[:-1], coordinates[1:])
+
+
+def haversine(a, b) -> np.ndarray:
+    """Row-wise great-circle distance in metres between two (n, 2) arrays of (lon, lat) coordinates"""
+    a = np.radians(np.asarray(a, dtype=float))
+    b = np.radians(np.asarray(b, dtype=float))
+    dlon = b[..., 0] - a[..., 0]
+    dlat = b[..., 1] - a[..., 1]
+    h = np.sin(dlat / 2) ** 2 + np.cos(a[..., 1]) * np.cos(b[..., 1]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def haversine_one_to_many(point, points) -> np.ndarray:
+    """Great-circle distance in metres from one (lon, lat) point to each row of an (n, 2) array"""
+    return haversine(np.asarray(point, dtype=float)[None, :], np.asarray(points, dtype=float))
+
+
+def haversine_pairwise(a, b) -> np.ndarray:
+    """(n, m) matrix of great-circle distances in metres between (lon, lat) point sets a and b"""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return haversine(a[:, None, :], b[None, :, :])
+
+
+def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Scalar great-circle distance in km, the signature ParkingAnalysis has always used"""
+    return float(haversine(np.array([lon1, lat1]), np.array([lon2, lat2]))) / 1000
+
+
+def nearest_within(point, points, max_distance: Optional[float] = None, geodesic: bool = True) -> np.ndarray:
+    """Indices of points sorted by straight-line distance to point, optionally cut at max_distance metres.
+
+    The straight-line distance is a lower bound of any network distance, so this is a safe pre-filter
+    for parking candidates before running graph searches.
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) == 0:
+        return np.empty(0, dtype=int)
+    distances = haversine_one_to_many(point, points) if geodesic else planar_one_to_many(point, points)
+    order = np.argsort(distances, kind="stable")
+    if max_distance is not None:
+        order = order[distances[order] <= max_distance]
+    return order
@@ -3,14 +3,12 @@ import os
 import networkx as nx
 
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
-from scipy.spatial.distance import cdist
 import utm
-from typing import List, Tuple, Union, Dict
+from typing import Dict, Iterable, List, Tuple, Union
 from scipy.spatial import KDTree
-from typing import List, Tuple, Dict
-from utils import get_category_color, parse_geojson, distance
+from utils import get_category_color, parse_geojson
+from Distance import segment_lengths
+from Simplify import contract_degree2_chains
 
 
 category_colors = {
@@ -61,15 +59,42 @@ category_scores = {
 default_category_score = 1  # Score for other categories
 
 
+def _snap_chain_node(graph: nx.Graph, node: Tuple) -> Tuple[Tuple, float]:
+    """Nearer end, along the chain, of the merged edge that a contracted node lies on"""
+    key, position = graph.graph["chain_nodes"][node]
+    distances = graph.graph["chain_geometry"][key].distance
+    before, after = float(distances[:position].sum()), float(distances[position:].sum())
+    nodes = graph.graph["chains"][key]
+    return (nodes[0], before) if before <= after else (nodes[-1], after)
+
+
 def find_nearest_node(graph: nx.Graph, target_node: Tuple) -> Tuple[Tuple, float]:
+    """Nearest graph node and its distance in metres for a UTM point or a (lon, lat) point/node key"""
     if target_node in graph.nodes():
         target_node = graph.nodes[target_node]["utm_coord"]
         #print("Debug: target_node =", target_node)
+    elif target_node in graph.graph.get("chain_nodes", {}):
+        return _snap_chain_node(graph, target_node)
+    elif abs(target_node[0]) <= 180 and abs(target_node[1]) <= 90:
+        # Far outside any UTM easting/northing, so this is lon/lat
+        target_node = utm.from_latlon(target_node[1], target_node[0])[:2]
     nodes_idx = graph.graph["kdTree"].query([target_node])
     node = list(graph.nodes())[nodes_idx[1][0]]
     return node, nodes_idx[0][0]
 
 
+def snap_node(graph: nx.Graph, node: Tuple) -> Tuple:
+    """Return node itself if it is in the graph, otherwise the nearest graph node"""
+    if node in graph:
+        return node
+    return find_nearest_node(graph, node)[0]
+
+
+def edge_cost(edge_data: Dict, weight: str = "weight") -> float:
+    """Cost of an edge under weight; "Parking Node" connectors only carry a distance, which stands in for it"""
+    return edge_data.get(weight, edge_data["distance"])
+
+
 def get_surface_category(surface_type: str, surface_categories: Dict) -> str:
     for category, types in surface_categories.items():
         if surface_type in types:
@@ -92,7 +117,12 @@ def add_times(graph):
         graph.edges[edge]['cycling_time'] = graph.edges[edge]['weight']/100
 
 
-def read_graph(alphaa: float = 1.0) -> nx.Graph:
+def read_graph(alphaa: float = 1.0, simplify: bool = False, keep: Iterable[Tuple] = ()) -> nx.Graph:
+    """Build the routing graph from the cycle network GeoJSON.
+
+    With simplify, degree-2 chains are contracted (see Simplify.contract_degree2_chains); the nodes nearest
+    to the points in keep, e.g. parking or POIs as (lon, lat), are never contracted.
+    """
     geojson_data = parse_geojson()
     graph = nx.Graph()
     for feature in geojson_data["features"]:
@@ -107,25 +137,35 @@ def read_graph(alphaa: float = 1.0) -> nx.Graph:
             properties = feature["properties"]
             category_color = get_category_color(properties, category_colors)
             surface = properties.get("surface")
-
-            for i in range(len(coordinates) - 1):
-                current_coord = tuple(coordinates[i])
-                next_coord = tuple(coordinates[i + 1])
-
-                dist = distance(graph.nodes[current_coord]["utm_coord"], graph.nodes[next_coord]["utm_coord"])
-                surface_score = surface_category_scores.get(
-                    get_surface_category(surface, surface_categories), default_surface_score
+            surface_score = surface_category_scores.get(
+                get_surface_category(surface, surface_categories), default_surface_score
+            )
+            category_score = category_scores.get(category_color, default_category_score)
+
+            nodes = [tuple(coord) for coord in coordinates]
+            dists = segment_lengths([graph.nodes[node]["utm_coord"] for node in nodes])
+            safeties = dists * (surface_score * category_score)
+            weights = (1 - alphaa) * dists + alphaa * safeties
+
+            for i in range(len(nodes) - 1):
+                graph.add_edge(
+                    nodes[i],
+                    nodes[i + 1],
+                    distance=float(dists[i]),
+                    safety=float(safeties[i]),
+                    category=category_color,
+                    surface=surface,
+                    weight=float(weights[i]),
                 )
-                category_score = category_scores.get(category_color, default_category_score)
-                weight = (1 - alphaa) * dist + alphaa * dist * surface_score * category_score
-
-                graph.add_edge(current_coord, next_coord, distance=dist, category=category_color, weight=weight)
 
     largest_connected_component = max(nx.connected_components(graph), key=len)
     graph = graph.subgraph(largest_connected_component).copy()
     coords = [node[1]["utm_coord"] for node in graph.nodes(data=True)]
     graph.graph["kdTree"] = KDTree(coords)
+    graph.graph["version"] = 0
     add_times(graph)
+    if simplify:
+        graph = contract_degree2_chains(graph, keep=[snap_node(graph, node) for node in keep])
     return graph
   
 
@@ -145,15 +185,13 @@ def calculate_shortest_safest_path(
                     coordinates = tuple(feature["geometry"]["coordinates"])
                     additional_points.append(coordinates)
 
-    if start_node not in list(graph.nodes):
-        start_node = find_nearest_node(graph, start_node)
-    if end_node not in list(graph.nodes):
-        end_node = find_nearest_node(graph, end_node)
+    start_node = snap_node(graph, start_node)
+    end_node = snap_node(graph, end_node)
 
     additional_start_nodes = [find_nearest_node(graph, poi_coord) for poi_coord in additional_points]
 
     try:
-        shortest_path = nx.shortest_path(graph, start_node, end_node, weight="weight")
+        shortest_path = nx.shortest_path(graph, start_node, end_node, weight=lambda u, v, d: edge_cost(d))
 
         if start_node in additional_points:
             start_index = additional_points.index(start_node)
@@ -177,6 +215,9 @@ def calculate_shortest_safest_path(
     
 
 if __name__ == "__main__":
+    # The plotting stack is only needed for this demo, keep it out of the routing core imports
+    import matplotlib.pyplot as plt
+
     # Example UTM coordinates for two points in Bonn, Germany (Zone 32T)
     start_node = (361750.487, 5620104.35012 ) # UTM coordinates for the starting point
     end_node =  (366342.797, 5621616.124) # UTM coordinates for the ending point
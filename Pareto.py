@@ -0,0 +1,148 @@
+import heapq
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import networkx as nx
+
+from Network import edge_cost, snap_node
+
+
+class ParetoRoute(NamedTuple):
+    path: List[Tuple]
+    distance: float  # metres
+    safety: float  # distance weighted by surface and category score
+    alpha_interval: Optional[Tuple[float, float]]  # None if no alpha makes this route optimal
+
+
+def _assign_alpha_intervals(frontier: List[Tuple[List, float, float]]) -> List[ParetoRoute]:
+    """Tag every route with the alpha range for which it minimises (1 - alpha) * distance + alpha * safety"""
+    # The routes that win for some alpha are the vertices of the lower convex hull in (distance, safety) space
+    hull: List[int] = []
+    for i, (_, d, s) in enumerate(frontier):
+        while len(hull) >= 2:
+            _, d1, s1 = frontier[hull[-2]]
+            _, d2, s2 = frontier[hull[-1]]
+            if (d2 - d1) * (s - s1) - (s2 - s1) * (d - d1) <= 0:
+                hull.pop()
+            else:
+                break
+        hull.append(i)
+
+    intervals: Dict[int, Tuple[float, float]] = {}
+    lower = 0.0
+    for k, i in enumerate(hull):
+        if k + 1 < len(hull):
+            _, d1, s1 = frontier[i]
+            _, d2, s2 = frontier[hull[k + 1]]
+            upper = float((d2 - d1) / ((d2 - d1) + (s1 - s2)))
+        else:
+            upper = 1.0
+        intervals[i] = (lower, upper)
+        lower = upper
+
+    return [ParetoRoute(path, d, s, intervals.get(i)) for i, (path, d, s) in enumerate(frontier)]
+
+
+def calculate_pareto_paths(
+    graph: nx.Graph, start_node: Tuple, end_node: Tuple, max_routes: Optional[int] = None, epsilon: float = 0.0
+) -> List[ParetoRoute]:
+    """Return all Pareto-optimal routes over (distance, safety) in a single bi-objective A* search.
+
+    Routes are ordered from shortest to safest. ``max_routes`` caps the size of the frontier (the safest
+    route is always kept) and ``epsilon`` prunes routes that are less than ``epsilon`` relatively safer
+    than one already found, which trades frontier resolution for search time. Edges without a safety
+    value (the "Parking Node" connectors) count with their distance.
+    """
+    start_node = snap_node(graph, start_node)
+    end_node = snap_node(graph, end_node)
+
+    # Exact lower bounds towards the target for both criteria
+    h_distance = nx.single_source_dijkstra_path_length(graph, end_node, weight="distance")
+    safest_pred, h_safety = nx.dijkstra_predecessor_and_distance(
+        graph, end_node, weight=lambda u, v, edge_data: edge_cost(edge_data, "safety")
+    )
+    if start_node not in h_distance:
+        return []
+
+    label_node: List[Tuple] = []
+    label_parent: List[int] = []
+    min_safety: Dict[Tuple, float] = {}
+    inf = float("inf")
+    factor = 1.0 + epsilon
+
+    label_node.append(start_node)
+    label_parent.append(-1)
+    queue = [(h_distance[start_node], h_safety[start_node], 0.0, 0.0, 0)]
+    frontier: List[Tuple[List, float, float]] = []
+    capped = False
+
+    while queue:
+        _, _, g_distance, g_safety, label = heapq.heappop(queue)
+        node = label_node[label]
+        if g_safety >= min_safety.get(node, inf):
+            continue
+        if (g_safety + h_safety[node]) * factor >= min_safety.get(end_node, inf):
+            continue
+        min_safety[node] = g_safety
+
+        if node == end_node:
+            path = []
+            while label != -1:
+                path.append(label_node[label])
+                label = label_parent[label]
+            frontier.append((path[::-1], g_distance, g_safety))
+            if max_routes is not None and len(frontier) >= max_routes:
+                capped = True
+                break
+            continue
+
+        for neighbor, edge_data in graph[node].items():
+            next_safety = g_safety + edge_cost(edge_data, "safety")
+            if next_safety >= min_safety.get(neighbor, inf):
+                continue
+            if (next_safety + h_safety[neighbor]) * factor >= min_safety.get(end_node, inf):
+                continue
+            next_distance = g_distance + edge_data["distance"]
+            label_node.append(neighbor)
+            label_parent.append(label)
+            heapq.heappush(
+                queue,
+                (next_distance + h_distance[neighbor], next_safety + h_safety[neighbor], next_distance, next_safety,
+                 len(label_node) - 1),
+            )
+
+    # A capped or epsilon-thinned search can miss the safe end of the frontier, so close it off with the
+    # safest route. Forward and backward safety sums differ by rounding, hence the relative tolerance.
+    safest = h_safety[start_node]
+    if frontier and (capped or epsilon > 0) and frontier[-1][2] - safest > 1e-9 * max(safest, 1.0):
+        path = [start_node]
+        while path[-1] != end_node:
+            path.append(safest_pred[path[-1]][0])
+        if all(path != route[0] for route in frontier):
+            total_distance = sum(graph[u][v]["distance"] for u, v in zip(path, path[1:]))
+            if capped:
+                frontier.pop()
+            frontier.append((path, total_distance, safest))
+
+    return _assign_alpha_intervals(frontier)
+
+
+def route_for_alpha(routes: List[ParetoRoute], alpha: float) -> Optional[ParetoRoute]:
+    """Pick the route of a frontier that ``read_graph(alpha)`` would have routed along"""
+    for route in routes:
+        if route.alpha_interval and route.alpha_interval[0] <= alpha <= route.alpha_interval[1]:
+            return route
+    return None
+
+
+if __name__ == "__main__":
+    from Network import read_graph
+
+    start_node = (361750.487, 5620104.35012)
+    end_node = (366342.797, 5621616.124)
+
+    graph = read_graph()
+    routes = calculate_pareto_paths(graph, start_node, end_node)
+    for route in routes:
+        interval = "not optimal for any alpha" if route.alpha_interval is None else \
+            "α in [{:.2f}, {:.2f}]".format(*route.alpha_interval)
+        print("{:.2f} km, safety {:.0f}: {}".format(route.distance / 1000, route.safety, interval))
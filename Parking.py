@@ -1,6 +1,8 @@
 import json
 import os
 
+from Distance import haversine_distance  # re-exported, ParkingAnalysis imports it from here
+
 # Parse the GeoJSON data for parking nodes
 def parse_parking_geojson():
     script_directory = os.path.dirname(os.path.abspath(__file__))
@@ -25,6 +27,93 @@ def parse_parking_geojson():
                     continue
     return parking_nodes
 
+# GBFS station_status / station_information fields mirrored onto the parking nodes of the graph
+station_status_fields = [
+    'capacity', 'num_bikes_available', 'num_docks_available', 'is_installed', 'is_renting', 'is_returning'
+]
+
+
+def parse_nextbike_stations(filename='Nextbike_bike_sharing_bonn.geojson'):
+    """Return {station_id: (coordinates, capacity)} for the Nextbike stations that carry a station ref"""
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(script_directory, filename), encoding='utf-8') as f:
+        station_data = json.load(f)
+
+    stations = {}
+    for feature in station_data['features']:
+        properties = feature.get('properties') or {}
+        station_id = properties.get('ref') or properties.get('id')
+        if station_id is None or feature['geometry']['type'] != 'Point':
+            continue
+        capacity = properties.get('capacity')
+        stations[str(station_id)] = (tuple(feature['geometry']['coordinates']), int(capacity) if capacity else None)
+    return stations
+
+
+def attach_nextbike_stations(graph, stations=None):
+    """Tag the parking nodes of the graph with their station id and index them for status updates"""
+    if stations is None:
+        stations = parse_nextbike_stations()
+    station_index = graph.graph.setdefault('stations', {})
+    for station_id, (coordinates, capacity) in stations.items():
+        if coordinates not in graph:
+            continue
+        graph.nodes[coordinates]['station_id'] = station_id
+        if capacity is not None:
+            graph.nodes[coordinates]['capacity'] = capacity
+        station_index[station_id] = coordinates
+    return station_index
+
+
+def update_station_status(graph, filename='Nextbike_station_status.json'):
+    """Apply a GBFS-style station status feed to the parking nodes in place.
+
+    Only stations whose values differ are touched, and the graph version is bumped once if anything
+    changed. Returns the number of updated stations.
+    """
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(script_directory, filename), encoding='utf-8') as f:
+        status = json.load(f)
+
+    station_index = graph.graph.get('stations', {})
+    changed = 0
+    for entry in status['data']['stations']:
+        node = station_index.get(str(entry.get('station_id')))
+        if node is None:
+            continue
+        attributes = graph.nodes[node]
+        updates = {
+            field: entry[field]
+            for field in station_status_fields
+            if field in entry and attributes.get(field) != entry[field]
+        }
+        if updates:
+            attributes.update(updates)
+            changed += 1
+    if changed:
+        graph.graph['version'] = graph.graph.get('version', 0) + 1
+    return changed
+
+
+def available_parking_nodes(graph, parking_nodes, dropoff=True):
+    """Drop stations that cannot serve the trip: full ones for a dropoff, empty ones for a pickup and
+    stations that are not installed"""
+    if dropoff:
+        count_field, flag_field = 'num_docks_available', 'is_returning'
+    else:
+        count_field, flag_field = 'num_bikes_available', 'is_renting'
+
+    available = []
+    for node in parking_nodes:
+        attributes = graph.nodes[node] if node in graph else {}
+        if attributes.get(count_field) == 0 or not attributes.get(flag_field, True) \
+                or not attributes.get('is_installed', True):
+            continue
+        available.append(node)
+    return available
+
+
 if __name__ == '__main__':
     parking_nodes = parse_parking_geojson()
     print("Number of Parking Nodes:", len(parking_nodes))
+    print("Number of Nextbike Stations:", len(parse_nextbike_stations()))
@@ -2,10 +2,11 @@ import json
 import os
 import sys
 import numpy as np
-from matplotlib import pyplot as plt
-from matplotlib.colors import ListedColormap
+from Distance import nearest_within
 from Network import calculate_shortest_safest_path, find_nearest_node, read_graph
-from Parking import parse_parking_geojson, haversine_distance
+from Parking import (
+    attach_nextbike_stations, available_parking_nodes, haversine_distance, parse_parking_geojson, update_station_status
+)
 from utils import get_category_color, parse_geojson, distance
 import utm
 import networkx as nx
@@ -24,6 +25,7 @@ def add_parking_to_graph(graph: "nx.Graph", parking_nodes: List[Tuple]) -> None:
             graph_node,
             category="Parking Node",
             distance=dist,
+            safety=dist,
         )
 
 
@@ -33,23 +35,31 @@ def parking_analysis(start_node: Tuple, end_node: Tuple, alphaa: float):
     # print(parking_nodes)
     graph = read_graph(alphaa)  # Initialize graph with a default value
     add_parking_to_graph(graph, parking_nodes)  # Add parking nodes to the graph
+    attach_nextbike_stations(graph)
+    update_station_status(graph)
 
     try:
+        # Full, uninstalled or non-returning stations cannot take the bike
+        available = available_parking_nodes(graph, parking_nodes)
+        if not available:
+            raise ValueError("No parking with free docks available")
+
         # Check if the end node is a parking node
-        if end_node in parking_nodes:
+        start_utm = utm.from_latlon(*start_node[::-1])[:2]
+        if end_node in available:
             # Calculate the normal shortest path
-            shortest_path, total_length, graph = calculate_shortest_safest_path(graph, start_node, end_node)
+            shortest_path, total_length, graph = calculate_shortest_safest_path(graph, start_utm, end_node)
             print("Walking Distance: 0 km")
             print("Shortest Distance from Source to Parking Node:", total_length, "km")
             print("Total Distance:", total_length, "km")
             return shortest_path, total_length, graph, None, parking_nodes
 
         # If the end node is not a parking node, find the nearest parking node
-        nearest_parking_node = find_nearest_node(parking_nodes, end_node)
+        nearest_parking_node = available[nearest_within(end_node, available)[0]]
 
         # Calculate the shortest path from start node to the nearest parking node
         shortest_path_to_parking, total_length_to_parking, graph = calculate_shortest_safest_path(
-            graph, start_node, nearest_parking_node
+            graph, start_utm, nearest_parking_node
         )
 
         # Check if the calculation was successful
@@ -90,6 +100,9 @@ def parking_analysis(start_node: Tuple, end_node: Tuple, alphaa: float):
 
 
 if __name__ == "__main__":
+    from matplotlib import pyplot as plt
+    from matplotlib.colors import ListedColormap
+
     # Set the working directory to the script's directory
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
     start_x, start_y = 7.096886, 50.740125
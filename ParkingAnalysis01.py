@@ -1,15 +1,12 @@
 import sys
 import traceback
 import networkx as nx
-import matplotlib.pyplot as plt
 import utm  
+from Distance import nearest_within
 from Network import calculate_shortest_safest_path, find_nearest_node, read_graph
-from Parking import parse_parking_geojson
+from Parking import attach_nextbike_stations, available_parking_nodes, parse_parking_geojson, update_station_status
 from utils import distance
 from typing import List, Tuple, Union, Dict
-from matplotlib.colors import ListedColormap
-import contextily as ctx  # Import contextily library
-import geopandas as gpd
 
 
 def add_parking_to_graph(graph: "nx.Graph", parking_nodes: List[Tuple]) -> None:
@@ -23,6 +20,7 @@ def add_parking_to_graph(graph: "nx.Graph", parking_nodes: List[Tuple]) -> None:
             graph_node,
             category="Parking Node",
             distance=dist,
+            safety=dist,
         )
 
 def calculate_walking_distances(graph, end_node, parking_nodes):
@@ -50,8 +48,17 @@ def calculate_bike_distances(graph, start_node, parking_nodes, alphaa):
         bike_distances[node] = distance
     return bike_paths, bike_distances
 
-def parking_analysis(start_node, end_node, alphaa, graph):
-    parking_nodes = parse_parking_geojson()
+def parking_analysis(start_node, end_node, alphaa, graph, max_walking_distance=None):
+    parking_nodes = available_parking_nodes(graph, parse_parking_geojson())
+    if not parking_nodes:
+        raise ValueError("No parking with free docks available")
+    if max_walking_distance is not None:
+        # Straight-line distance bounds the walk from below, so farther parking can never qualify
+        candidates = nearest_within(end_node, parking_nodes, max_walking_distance)
+        if len(candidates) == 0:
+            # Nothing within walking range, fall back to the station nearest to the destination
+            candidates = nearest_within(end_node, parking_nodes)[:1]
+        parking_nodes = [parking_nodes[i] for i in candidates]
     #graph = read_graph(alphaa)
 
     #add_parking_to_graph(graph, parking_nodes)
@@ -88,7 +95,8 @@ def parking_analysis(start_node, end_node, alphaa, graph):
 
 
 def main():
-    
+        import matplotlib.pyplot as plt
+
         start_node = (7.1071226, 50.7319471)
         end_node = (7.0931056, 50.7264752)
         alpha_value = 0
@@ -97,6 +105,8 @@ def main():
         graph = read_graph(alpha_value)
         parking_nodes = parse_parking_geojson()
         add_parking_to_graph(graph, parking_nodes)
+        attach_nextbike_stations(graph)
+        update_station_status(graph)
         
         # Perform parking analysis
         path, total_distance, bike_distance, walking_distance, graph, bike_path_start_to_parking, walking_path_parking_to_node, min_distance_parking_node  = parking_analysis(start_node, end_node, alpha_value, graph)
@@ -186,6 +196,8 @@ def main():
         #legend_text = f'α = {alpha_value:.2f}'
         #egend_elements.append(plt.Line2D([0], [0], color='white', label=legend_text))
         # Convert pos dictionary to a GeoDataFrame
+        #import contextily as ctx
+        #import geopandas as gpd
         #gdf = gpd.GeoDataFrame(geometry=gpd.points_from_xy(*zip(*pos.values())))
 
         # Set the CRS explicitly
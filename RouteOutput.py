@@ -0,0 +1,249 @@
+import json
+import struct
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+
+from Network import category_colors
+from Simplify import expand_edges
+
+# Codes used for the per-segment category column, in the order of Network.category_colors
+route_categories = list(category_colors) + ["Parking Node"]
+_category_codes = {category: code for code, category in enumerate(route_categories)}
+
+
+class RouteArrays(NamedTuple):
+    coords: np.ndarray  # (n, 2) lon/lat
+    category: np.ndarray  # (n - 1,) int8 codes into route_categories
+    distance: np.ndarray  # (n - 1,) metres
+    cycling_time: np.ndarray  # (n - 1,) NaN where the edge has no cycling time
+    walking_time: np.ndarray  # (n - 1,)
+
+
+class RouteSummary(NamedTuple):
+    total_length: float  # km
+    cycling_time: float
+    walking_time: float
+    category_lengths: Dict[str, float]  # km per category
+    segments: int
+
+
+def route_arrays(graph: nx.Graph, path: List[Tuple]) -> RouteArrays:
+    """Columnar form of a route: coordinates plus one row per segment, merged chains expanded"""
+    pieces = list(expand_edges(graph, path))
+    edges = [edge_data for _, _, edge_data in pieces]
+    return RouteArrays(
+        coords=np.array(list(path[:1]) + [v for _, v, _ in pieces], dtype=np.float64).reshape(-1, 2),
+        category=np.array([_category_codes.get(e.get("category"), -1) for e in edges], dtype=np.int8),
+        distance=np.array([e["distance"] for e in edges], dtype=np.float64),
+        cycling_time=np.array([e.get("cycling_time", np.nan) for e in edges], dtype=np.float64),
+        walking_time=np.array([e.get("walking_time", np.nan) for e in edges], dtype=np.float64),
+    )
+
+
+def route_summary(graph: nx.Graph, path: Iterable[Tuple]) -> RouteSummary:
+    """Totals of a route, computed edge by edge without building any geometry. Merged chains are split
+    into their original edges"""
+    total = cycling = walking = 0.0
+    category_lengths: Dict[str, float] = {}
+    segments = 0
+    for _, _, edge_data in expand_edges(graph, path):
+        total += edge_data["distance"]
+        cycling += edge_data.get("cycling_time", 0.0)
+        walking += edge_data.get("walking_time", 0.0)
+        category = edge_data.get("category", "No Infrastructure")
+        category_lengths[category] = category_lengths.get(category, 0.0) + edge_data["distance"] / 1000
+        segments += 1
+    return RouteSummary(float(total) / 1000, float(cycling), float(walking), category_lengths, segments)
+
+
+def encode_polyline(coords, precision: int = 5, graph: Optional[nx.Graph] = None) -> str:
+    """Encode (lon, lat) coordinates with the Google encoded polyline algorithm.
+
+    With a graph, coords is a route over it and merged chains are expanded to their full geometry.
+    """
+    if graph is not None:
+        coords = list(coords[:1]) + [v for _, v, _ in expand_edges(graph, coords)]
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    scaled = np.round(coords[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chars = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+
+def decode_polyline(polyline: str, precision: int = 5) -> np.ndarray:
+    """Decode an encoded polyline back into an (n, 2) array of (lon, lat)"""
+    values = []
+    value = shift = 0
+    for char in polyline:
+        byte = ord(char) - 63
+        value |= (byte & 0x1F) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    latlon = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return latlon[:, ::-1]
+
+
+class GeoJSONRouteWriter:
+    """Stream routes into a GeoJSON FeatureCollection one feature at a time"""
+
+    def __init__(self, path: str, precision: int = 6):
+        self.precision = precision
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write('{"type":"FeatureCollection","features":[')
+        self._count = 0
+
+    def write(self, coords, properties: Optional[Dict] = None) -> None:
+        coordinates = np.round(np.asarray(coords, dtype=np.float64).reshape(-1, 2), self.precision).tolist()
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+            "properties": properties or {},
+        }
+        if self._count:
+            self._file.write(",")
+        self._file.write(json.dumps(feature, separators=(",", ":")))
+        self._count += 1
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.write("]}")
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _linestring_wkb(coords) -> bytes:
+    coords = np.ascontiguousarray(coords, dtype="<f8").reshape(-1, 2)
+    return struct.pack("<BII", 1, 2, len(coords)) + coords.tobytes()
+
+
+def _property_value(value):
+    # Nested values such as RouteSummary.category_lengths are stored as JSON text
+    return json.dumps(value, separators=(",", ":")) if isinstance(value, (dict, list, tuple)) else value
+
+
+class GeoParquetRouteWriter:
+    """Stream routes into a GeoParquet file in row groups of batch_size. Needs pyarrow.
+
+    Dict and list property values are written as JSON strings. Without an explicit schema (a pyarrow schema
+    of the property columns) the first batch fixes it: its keys become the columns and columns that are
+    still None are typed as strings. Later keys or values of another type raise a ValueError instead of
+    being cast, integers in a float column are the only widening applied. Closing a writer without rows
+    still writes a file with the schema and no rows.
+    """
+
+    def __init__(self, path: str, batch_size: int = 1000, schema=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("GeoParquet output needs pyarrow, install it with 'pip install pyarrow'") from e
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.batch_size = batch_size
+        self.schema = schema
+        self._writer = None
+        self._closed = False
+        self._geometries: List[bytes] = []
+        self._properties: List[Dict] = []
+
+    def write(self, coords, properties: Optional[Dict] = None) -> None:
+        self._geometries.append(_linestring_wkb(coords))
+        self._properties.append(properties or {})
+        if len(self._geometries) >= self.batch_size:
+            self._flush()
+
+    def _open(self, properties_schema) -> None:
+        pa = self._pa
+        fields = [
+            field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+            for field in properties_schema
+            if field.name != "geometry"
+        ]
+        geo = {
+            "version": "1.0.0",
+            "primary_column": "geometry",
+            "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["LineString"]}},
+        }
+        fields.append(pa.field("geometry", pa.binary()))
+        schema = pa.schema(fields, metadata={b"geo": json.dumps(geo).encode("utf-8")})
+        self._writer = self._pq.ParquetWriter(self.path, schema)
+
+    def _conform(self, table, schema):
+        """Bring a batch to the schema of the file, raising on anything that is not a lossless widening"""
+        pa = self._pa
+        extra = [name for name in table.column_names if name not in schema.names]
+        if extra:
+            raise ValueError(f"Route properties {extra} are not in the GeoParquet schema {schema.names}")
+        columns = []
+        for field in schema:
+            if field.name not in table.column_names:
+                columns.append(pa.nulls(table.num_rows, field.type))
+                continue
+            column = table.column(field.name)
+            if column.type != field.type:
+                widening = pa.types.is_integer(column.type) and pa.types.is_floating(field.type)
+                if not (pa.types.is_null(column.type) or widening):
+                    raise ValueError(f"Route property {field.name!r} changed type from {field.type} to {column.type}")
+                column = column.cast(field.type)
+            columns.append(column)
+        return pa.table(columns, schema=schema)
+
+    def _flush(self) -> None:
+        if not self._geometries:
+            return
+        keys = list(dict.fromkeys(key for row in self._properties for key in row))
+        columns = {key: [_property_value(row.get(key)) for row in self._properties] for key in keys}
+        columns["geometry"] = self._geometries
+        table = self._pa.table(columns)
+        self._geometries = []
+        self._properties = []
+        if self._writer is None:
+            self._open(self.schema if self.schema is not None else table.schema)
+        self._writer.write_table(self._conform(table, self._writer.schema))
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._flush()
+        if self._writer is None:
+            self._open(self.schema if self.schema is not None else self._pa.schema([]))
+        self._writer.close()
+        self._writer = None
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    from Network import calculate_shortest_safest_path, read_graph
+
+    start_node = (361750.487, 5620104.35012)
+    end_node = (366342.797, 5621616.124)
+
+    graph = read_graph(1)
+    shortest_path, total_length, _ = calculate_shortest_safest_path(graph, start_node, end_node)
+    print(route_summary(graph, shortest_path))
+    print("Encoded polyline:", encode_polyline(shortest_path))
+    with GeoJSONRouteWriter("routes.geojson") as writer:
+        writer.write(shortest_path, route_summary(graph, shortest_path)._asdict())
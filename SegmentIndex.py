@@ -0,0 +1,307 @@
+import heapq
+import itertools
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+
+from Network import edge_cost
+from Simplify import edge_geometry
+
+NODE_CAPACITY = 16  # children per packed R-tree node
+
+
+class SegmentMatch(NamedTuple):
+    segment: np.ndarray  # (q,) index into SegmentIndex.edges
+    projection: np.ndarray  # (q, 2) UTM point on the segment
+    offset: np.ndarray  # (q,) metres from the first node of the edge to the projection, along merged chains
+    fraction: np.ndarray  # (q,) offset relative to the edge length
+    distance: np.ndarray  # (q,) metres from the query point to the projection
+
+
+def _str_order(bbox: np.ndarray, capacity: int) -> np.ndarray:
+    """Sort-Tile-Recursive order: vertical slices by x centre, each sorted by y centre"""
+    count = len(bbox)
+    slices = int(np.ceil(np.sqrt(np.ceil(count / capacity))))
+    slice_size = slices * capacity
+    centers = (bbox[:, :2] + bbox[:, 2:]) / 2
+    by_x = np.argsort(centers[:, 0], kind="stable")
+    order = [
+        chunk[np.argsort(centers[chunk, 1], kind="stable")]
+        for chunk in (by_x[i:i + slice_size] for i in range(0, count, slice_size))
+    ]
+    return np.concatenate(order) if order else by_x
+
+
+def _group_bbox(bbox: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    return np.column_stack([
+        np.minimum.reduceat(bbox[:, 0], starts),
+        np.minimum.reduceat(bbox[:, 1], starts),
+        np.maximum.reduceat(bbox[:, 2], starts),
+        np.maximum.reduceat(bbox[:, 3], starts),
+    ])
+
+
+class SegmentIndex:
+    """Packed STR R-tree over the UTM segments of the routing graph.
+
+    An edge merged by Simplify contributes the straight pieces of the chain it replaced: edges[i] is the
+    graph edge that segment i lies on and segment_nodes[i] the end nodes of the piece itself.
+
+    Queries are batched and evaluated level by level for all points at once: every (point, node) pair
+    whose box is farther than the point's current upper bound is pruned before descending. Closed edges
+    are masked rather than removed, see edge_changed.
+    """
+
+    def __init__(self, graph: nx.Graph, capacity: int = NODE_CAPACITY):
+        self.edges: List[Tuple[Tuple, Tuple]] = []
+        self.segment_nodes: List[Tuple[Tuple, Tuple]] = []
+        self._edge_segments: Dict[frozenset, List[int]] = {}
+        chains = graph.graph.get("chains", {})
+        start, end, pieces = [], [], []
+        for u, v, category in graph.edges(data="category"):
+            if u == v or category == "Parking Node":
+                continue
+            if (u, v) in chains or (v, u) in chains:
+                nodes, utm_coord, _ = edge_geometry(graph, u, v)
+                start.extend(utm_coord[:-1])
+                end.extend(utm_coord[1:])
+            else:
+                nodes = [u, v]
+                start.append(graph.nodes[u]["utm_coord"])
+                end.append(graph.nodes[v]["utm_coord"])
+            self._edge_segments[frozenset((u, v))] = list(range(len(self.edges), len(self.edges) + len(nodes) - 1))
+            self.edges.extend([(u, v)] * (len(nodes) - 1))
+            self.segment_nodes.extend(zip(nodes, nodes[1:]))
+            pieces.append(len(nodes) - 1)
+        self.version = graph.graph.get("edge_version", 0)
+        self.active = np.ones(len(self.edges), dtype=bool)
+        self._open_counts: Optional[List[np.ndarray]] = None
+        self.start = np.array(start, dtype=np.float64).reshape(-1, 2)
+        self.end = np.array(end, dtype=np.float64).reshape(-1, 2)
+
+        # Offset of every segment from the first node of its edge, and the length of the whole edge
+        lengths = np.hypot(*(self.end - self.start).T)
+        pieces = np.array(pieces, dtype=np.int64)
+        first = np.cumsum(pieces) - pieces
+        before = np.cumsum(lengths) - lengths
+        self.edge_offset = before - np.repeat(before[first], pieces)
+        self.edge_length = np.repeat(np.add.reduceat(lengths, first), pieces) if len(pieces) else np.zeros(0)
+
+        bbox = np.hstack([np.minimum(self.start, self.end), np.maximum(self.start, self.end)])
+        order = _str_order(bbox, capacity)
+        self.segment_ids = order
+        self.segment_bbox = bbox[order]
+
+        # levels[0] is the root, levels[-1] points into segment_ids
+        self.levels: List[Dict[str, np.ndarray]] = []
+        items = self.segment_bbox
+        while True:
+            starts = np.arange(0, len(items), capacity)
+            ends = np.minimum(starts + capacity, len(items))
+            node_bbox = _group_bbox(items, starts) if len(items) else np.zeros((0, 4))
+            if len(node_bbox) > 1:
+                perm = _str_order(node_bbox, capacity)
+                node_bbox, starts, ends = node_bbox[perm], starts[perm], ends[perm]
+            self.levels.insert(0, {"bbox": node_bbox, "start": starts, "end": ends})
+            if len(node_bbox) <= 1:
+                break
+            items = node_bbox
+
+    def __len__(self) -> int:
+        return len(self.edges)
+
+    def edge_changed(self, graph: nx.Graph, u: Tuple, v: Tuple) -> bool:
+        """Mask or unmask the segments of an edge after it was closed or reopened.
+
+        Returns False if the graph has gained an edge the index does not know, the index must then be rebuilt.
+        """
+        segments = self._edge_segments.get(frozenset((u, v)))
+        if segments is not None:
+            self.active[segments] = graph.has_edge(u, v)
+            self._open_counts = None
+        elif graph.has_edge(u, v) and u != v and graph.edges[u, v].get("category") != "Parking Node":
+            return False
+        self.version = graph.graph.get("edge_version", 0)
+        return True
+
+    def _open_segment_counts(self) -> List[np.ndarray]:
+        """Open segments below every tree node, per level below the root and for the leaves last"""
+        if self._open_counts is None:
+            counts = self.active[self.segment_ids].astype(np.int64)
+            per_level = [counts]
+            for level in self.levels[:0:-1]:
+                cumulative = np.concatenate([[0], np.cumsum(counts)])
+                counts = cumulative[level["end"]] - cumulative[level["start"]]
+                per_level.insert(0, counts)
+            self._open_counts = per_level
+        return self._open_counts
+
+    @staticmethod
+    def _box_distances(points: np.ndarray, bbox: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Minimum and maximum distance from each point to its paired box"""
+        dx = np.maximum(np.maximum(bbox[:, 0] - points[:, 0], points[:, 0] - bbox[:, 2]), 0)
+        dy = np.maximum(np.maximum(bbox[:, 1] - points[:, 1], points[:, 1] - bbox[:, 3]), 0)
+        far_x = np.maximum(np.abs(points[:, 0] - bbox[:, 0]), np.abs(points[:, 0] - bbox[:, 2]))
+        far_y = np.maximum(np.abs(points[:, 1] - bbox[:, 1]), np.abs(points[:, 1] - bbox[:, 3]))
+        return np.hypot(dx, dy), np.hypot(far_x, far_y)
+
+    def project(self, points, segments) -> SegmentMatch:
+        """Project each point onto its paired segment"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        segments = np.asarray(segments, dtype=np.int64)
+        a, b = self.start[segments], self.end[segments]
+        direction = b - a
+        length_sq = np.einsum("ij,ij->i", direction, direction)
+        fraction = np.einsum("ij,ij->i", points - a, direction) / np.where(length_sq > 0, length_sq, 1.0)
+        fraction = np.clip(fraction, 0.0, 1.0)
+        projection = a + fraction[:, None] * direction
+        distance = np.hypot(*(points - projection).T)
+        offset = self.edge_offset[segments] + fraction * np.sqrt(length_sq)
+        edge_length = self.edge_length[segments]
+        # Rounding can push the fraction just past 1, which would give negative costs to the far end
+        edge_fraction = np.clip(offset / np.where(edge_length > 0, edge_length, 1.0), 0.0, 1.0)
+        return SegmentMatch(segments, projection, offset, edge_fraction, distance)
+
+    def nearest(self, points) -> SegmentMatch:
+        """Nearest segment, projection point and offset along the edge for a batch of UTM points"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        count = len(points)
+        if count == 0 or len(self.edges) == 0:
+            raise ValueError("Nearest segment query needs points and a non-empty index")
+
+        # Boxes without an open segment give no upper bound and are skipped
+        open_counts = None if self.active.all() else self._open_segment_counts()
+        pair_point = np.arange(count)
+        pair_node = np.zeros(count, dtype=np.int64)
+        for depth, level in enumerate(self.levels):
+            starts, ends = level["start"][pair_node], level["end"][pair_node]
+            sizes = ends - starts
+            pair_point = np.repeat(pair_point, sizes)
+            pair_node = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+            if open_counts is not None:
+                is_open = open_counts[depth][pair_node] > 0
+                pair_point, pair_node = pair_point[is_open], pair_node[is_open]
+            if depth + 1 < len(self.levels):
+                child_bbox = self.levels[depth + 1]["bbox"][pair_node]
+            else:
+                child_bbox = self.segment_bbox[pair_node]
+            min_dist, max_dist = self._box_distances(points[pair_point], child_bbox)
+            bound = np.full(count, np.inf)
+            np.minimum.at(bound, pair_point, max_dist)
+            keep = min_dist <= bound[pair_point]
+            pair_point, pair_node = pair_point[keep], pair_node[keep]
+
+        if len(np.unique(pair_point)) < count:
+            raise ValueError("Nearest segment query found no open segment")
+        matches = self.project(points[pair_point], self.segment_ids[pair_node])
+        order = np.lexsort((matches.distance, pair_point))
+        first = order[np.r_[True, pair_point[order][1:] != pair_point[order][:-1]]]
+        return SegmentMatch(*(column[first] for column in matches))
+
+
+def get_segment_index(graph: nx.Graph) -> SegmentIndex:
+    """Build the segment index on first use and keep it next to the node KD-tree.
+
+    Closures keeps the index in step with closed and reopened edges; any other change of the edge
+    version makes it stale and it is rebuilt here. The graph version, which station status updates bump
+    as well, is not looked at.
+    """
+    index = graph.graph.get("segmentIndex")
+    if index is None or index.version != graph.graph.get("edge_version", 0):
+        index = graph.graph["segmentIndex"] = SegmentIndex(graph)
+    return index
+
+
+def _virtual_node(index: SegmentIndex, match: SegmentMatch, i: int) -> Tuple[Tuple, Tuple, float, Tuple]:
+    """Edge, fraction from its first node and lon/lat of the virtual node for query i"""
+    segment = int(match.segment[i])
+    u, v = index.edges[segment]
+    first, second = index.segment_nodes[segment]
+    length = float(np.hypot(*(index.end[segment] - index.start[segment])))
+    along = (float(match.offset[i]) - index.edge_offset[segment]) / length if length > 0 else 0.0
+    coord = tuple(float(a + along * (b - a)) for a, b in zip(first, second))
+    return u, v, float(match.fraction[i]), coord
+
+
+def calculate_path_between_points(
+    graph: nx.Graph, start_point: Tuple, end_point: Tuple, weight: str = "weight"
+) -> Tuple[List, float]:
+    """Route between two UTM points from virtual nodes on their nearest edges, leaving the graph untouched.
+
+    Returns the path (virtual start, graph nodes..., virtual end) as lon/lat tuples and its length in km.
+    """
+    index = get_segment_index(graph)
+    while True:
+        match = index.nearest([start_point, end_point])
+        # Edges removed behind the index's back are masked and the query repeated
+        missing = [index.edges[i] for i in match.segment.tolist() if not graph.has_edge(*index.edges[i])]
+        if not missing:
+            break
+        for u, v in missing:
+            index.edge_changed(graph, u, v)
+    su, sv, s_fraction, s_coord = _virtual_node(index, match, 0)
+    tu, tv, t_fraction, t_coord = _virtual_node(index, match, 1)
+    start_edge, end_edge = graph[su][sv], graph[tu][tv]
+
+    # Entering the graph at either end of the start edge costs the matching part of that edge
+    dist: Dict[Tuple, float] = {}
+    pred: Dict[Tuple, Tuple] = {}
+    tie = itertools.count()
+    queue = [
+        (edge_cost(start_edge, weight) * s_fraction, next(tie), su, None),
+        (edge_cost(start_edge, weight) * (1 - s_fraction), next(tie), sv, None),
+    ]
+    exits = {tu: edge_cost(end_edge, weight) * t_fraction, tv: edge_cost(end_edge, weight) * (1 - t_fraction)}
+    best, best_exit = float("inf"), None
+    if {su, sv} == {tu, tv}:
+        t_from_su = t_fraction if su == tu else 1 - t_fraction
+        best = edge_cost(start_edge, weight) * abs(t_from_su - s_fraction)
+
+    while queue:
+        d, _, node, parent = heapq.heappop(queue)
+        if node in dist or d >= best:
+            continue
+        dist[node] = d
+        pred[node] = parent
+        if node in exits and d + exits[node] < best:
+            best, best_exit = d + exits[node], node
+        for neighbor, edge_data in graph[node].items():
+            if neighbor not in dist:
+                heapq.heappush(queue, (d + edge_cost(edge_data, weight), next(tie), neighbor, node))
+
+    if best == float("inf"):
+        return [], 0
+
+    nodes = []
+    node = best_exit
+    while node is not None:
+        nodes.append(node)
+        node = pred[node]
+    nodes.reverse()
+
+    def part(edge_data, node, u, fraction):
+        return edge_data["distance"] * (fraction if node == u else 1 - fraction)
+
+    if not nodes:
+        total_length = start_edge["distance"] * abs(
+            (t_fraction if su == tu else 1 - t_fraction) - s_fraction
+        )
+    else:
+        total_length = part(start_edge, nodes[0], su, s_fraction) + part(end_edge, nodes[-1], tu, t_fraction)
+        total_length += sum(graph[a][b]["distance"] for a, b in zip(nodes, nodes[1:]))
+    return [s_coord] + nodes + [t_coord], float(total_length) / 1000
+
+
+if __name__ == "__main__":
+    from Network import find_nearest_node, read_graph
+
+    start_node = (361750.487, 5620104.35012)
+    end_node = (366342.797, 5621616.124)
+
+    graph = read_graph(1)
+    match = get_segment_index(graph).nearest([start_node, end_node])
+    for point, offset in zip([start_node, end_node], match.distance):
+        print(f"Nearest vertex {find_nearest_node(graph, point)[1]:.1f} m away, nearest edge {offset:.1f} m away")
+    shortest_path, total_length = calculate_path_between_points(graph, start_node, end_node)
+    print("Total length:", total_length, "km")
@@ -0,0 +1,294 @@
+import json
+import mmap
+import os
+import sys
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+import utm
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from Network import edge_cost
+
+ALIGNMENT = 64
+HEADER_SIZE = 8  # little-endian length of the JSON manifest that follows
+GRID_CELL_SIZE = 250.0  # metres per spatial index cell
+
+edge_attributes = ["distance", "weight", "safety", "walking_time", "cycling_time"]
+
+
+def _grid_index(points: np.ndarray, cell_size: float) -> Dict[str, np.ndarray]:
+    """Bucket points into a uniform UTM grid stored as CSR arrays (cell offsets, point ids)"""
+    origin = points.min(axis=0) if len(points) else np.zeros(2)
+    cells = np.floor((points - origin) / cell_size).astype(np.int64)
+    shape = cells.max(axis=0) + 1 if len(points) else np.ones(2, dtype=np.int64)
+    cell_ids = cells[:, 1] * shape[0] + cells[:, 0]
+    order = np.argsort(cell_ids, kind="stable").astype(np.int32)
+    offsets = np.searchsorted(cell_ids[order], np.arange(shape[0] * shape[1] + 1)).astype(np.int32)
+    return {
+        "grid_origin": origin.astype(np.float64),
+        "grid_shape": shape.astype(np.int64),
+        "grid_offsets": offsets,
+        "grid_points": order,
+    }
+
+
+def export_graph_arrays(graph: nx.Graph, parking_nodes: Iterable[Tuple] = ()) -> Tuple[Dict[str, np.ndarray], Dict]:
+    """Flatten a read_graph graph into CSR adjacency, edge attribute columns, a grid index and a parking table"""
+    nodes = list(graph.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    categories = sorted({data.get("category", "") for _, _, data in graph.edges(data=True)})
+    category_codes = {category: code for code, category in enumerate(categories)}
+
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+    indices: List[int] = []
+    columns: Dict[str, List[float]] = {name: [] for name in edge_attributes}
+    category_column: List[int] = []
+    for i, node in enumerate(nodes):
+        for neighbor, data in graph[node].items():
+            indices.append(index[neighbor])
+            for name in edge_attributes:
+                columns[name].append(edge_cost(data, name))
+            category_column.append(category_codes[data.get("category", "")])
+        indptr[i + 1] = len(indices)
+
+    node_coords = np.array(nodes, dtype=np.float64).reshape(-1, 2)
+    node_utm = np.array([graph.nodes[node]["utm_coord"] for node in nodes], dtype=np.float64).reshape(-1, 2)
+    arrays = {
+        "node_coords": node_coords,
+        "node_utm": node_utm,
+        "indptr": indptr,
+        "indices": np.array(indices, dtype=np.int32),
+        "edge_category": np.array(category_column, dtype=np.int16),
+    }
+    for name in edge_attributes:
+        arrays[f"edge_{name}"] = np.array(columns[name], dtype=np.float64)
+    arrays.update(_grid_index(node_utm, GRID_CELL_SIZE))
+
+    parking_nodes = list(parking_nodes)
+    arrays["parking_coords"] = np.array(parking_nodes, dtype=np.float64).reshape(-1, 2)
+    arrays["parking_node"] = np.array([index.get(node, -1) for node in parking_nodes], dtype=np.int32)
+    for field in ["capacity", "num_bikes_available", "num_docks_available"]:
+        arrays[f"parking_{field}"] = np.array(
+            [graph.nodes[node].get(field, -1) if node in graph else -1 for node in parking_nodes], dtype=np.int32
+        )
+    # Stations without a live status count as installed, renting and returning, as in Parking.available_parking_nodes
+    for field in ["is_installed", "is_renting", "is_returning"]:
+        arrays[f"parking_{field}"] = np.array(
+            [bool(graph.nodes[node].get(field, True)) if node in graph else True for node in parking_nodes],
+            dtype=np.int8,
+        )
+
+    meta = {"categories": categories, "version": graph.graph.get("version", 0), "cell_size": GRID_CELL_SIZE}
+    return arrays, meta
+
+
+def _manifest(arrays: Dict[str, np.ndarray], meta: Dict) -> Tuple[bytes, int, int]:
+    """Serialize the array layout; offsets are relative to the aligned end of the manifest"""
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    manifest = json.dumps({"arrays": layout, "meta": meta}).encode("utf-8")
+    return manifest, _data_start(len(manifest)), offset
+
+
+def _data_start(manifest_length: int) -> int:
+    return -(-(HEADER_SIZE + manifest_length) // ALIGNMENT) * ALIGNMENT
+
+
+class SharedGraph:
+    """Read-only routing graph backed by one shared memory block or memory-mapped file.
+
+    The parent calls ``SharedGraph.publish(graph, parking_nodes)`` once and hands ``shared.name`` to its
+    workers, which call ``SharedGraph.attach(name)``. All arrays are views into the shared buffer, so a
+    worker only pays for its own search state.
+    """
+
+    def __init__(self, buffer, name: str, owner: bool, handle=None):
+        self.name = name
+        self.owner = owner
+        self._handle = handle
+        self._buffer = buffer
+        manifest_length = int.from_bytes(bytes(buffer[:HEADER_SIZE]), "little")
+        manifest = json.loads(bytes(buffer[HEADER_SIZE:HEADER_SIZE + manifest_length]).decode("utf-8"))
+        data_start = _data_start(manifest_length)
+        self.meta = manifest["meta"]
+        self.arrays: Dict[str, np.ndarray] = {}
+        for key, entry in manifest["arrays"].items():
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"], dtype=np.int64))
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + entry["offset"])
+            array = array.reshape(entry["shape"])
+            array.flags.writeable = False
+            self.arrays[key] = array
+            setattr(self, key, array)
+        self.categories: List[str] = self.meta["categories"]
+        self._matrices: Dict[str, csr_matrix] = {}
+
+    @classmethod
+    def publish(cls, graph: nx.Graph, parking_nodes: Iterable[Tuple] = (), path: Optional[str] = None) -> "SharedGraph":
+        """Copy the graph into shared memory, or into a memory-mapped file if path is given"""
+        arrays, meta = export_graph_arrays(graph, parking_nodes)
+        manifest, data_start, data_size = _manifest(arrays, meta)
+        size = max(data_start + data_size, 1)
+
+        if path is None:
+            handle = shared_memory.SharedMemory(create=True, size=size)
+            buffer, name = handle.buf, handle.name
+        else:
+            with open(path, "w+b") as f:
+                f.truncate(size)
+                handle = mmap.mmap(f.fileno(), size)
+            buffer, name = memoryview(handle), path
+
+        buffer[:HEADER_SIZE] = len(manifest).to_bytes(HEADER_SIZE, "little")
+        buffer[HEADER_SIZE:HEADER_SIZE + len(manifest)] = manifest
+        offset = data_start
+        for array in arrays.values():
+            np.frombuffer(buffer, dtype=array.dtype, count=array.size, offset=offset)[:] = array.ravel()
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        return cls(buffer, name, owner=True, handle=handle)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedGraph":
+        """Map a published graph read-only without copying it"""
+        if os.path.isfile(name):
+            with open(name, "rb") as f:
+                handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(memoryview(handle), name, owner=False, handle=handle)
+
+        if sys.version_info >= (3, 13):
+            handle = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Only the publishing process may unlink the block, so keep it away from the resource tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda name, rtype: None
+            try:
+                handle = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        return cls(handle.buf, name, owner=False, handle=handle)
+
+    def close(self) -> None:
+        """Release the mapping; the owner also removes the block or file. Views of the arrays must be gone"""
+        self.arrays.clear()
+        self._matrices.clear()
+        for key in list(vars(self)):
+            if isinstance(getattr(self, key), np.ndarray):
+                delattr(self, key)
+        if isinstance(self._buffer, memoryview):
+            self._buffer.release()
+        self._buffer = None
+        self._handle.close()
+        if self.owner and isinstance(self._handle, shared_memory.SharedMemory):
+            self._handle.unlink()
+        elif self.owner:
+            os.remove(self.name)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def matrix(self, weight: str = "weight") -> csr_matrix:
+        """CSR adjacency over a shared edge attribute column; scipy keeps the arrays as views"""
+        if weight not in self._matrices:
+            n = len(self.node_coords)
+            self._matrices[weight] = csr_matrix(
+                (self.arrays[f"edge_{weight}"], self.indices, self.indptr), shape=(n, n), copy=False
+            )
+        return self._matrices[weight]
+
+    def find_nearest_node(self, target_node: Tuple) -> Tuple[int, float]:
+        """Index of and distance to the node nearest to a UTM point, using the shared grid index"""
+        point = np.asarray(target_node, dtype=np.float64)
+        cell_size = self.meta["cell_size"]
+        shape = self.grid_shape
+        cx, cy = np.clip(np.floor((point - self.grid_origin) / cell_size).astype(np.int64), 0, shape - 1)
+
+        best, best_dist = -1, np.inf
+        for ring in range(int(max(shape)) + 1):
+            x_range = range(max(cx - ring, 0), min(cx + ring, shape[0] - 1) + 1)
+            y_range = range(max(cy - ring, 0), min(cy + ring, shape[1] - 1) + 1)
+            for y in y_range:
+                xs = x_range if abs(y - cy) == ring else [x for x in (cx - ring, cx + ring) if x in x_range]
+                for x in xs:
+                    cell = y * shape[0] + x
+                    members = self.grid_points[self.grid_offsets[cell]:self.grid_offsets[cell + 1]]
+                    if len(members) == 0:
+                        continue
+                    delta = self.node_utm[members] - point
+                    dists = np.hypot(delta[:, 0], delta[:, 1])
+                    i = int(np.argmin(dists))
+                    if dists[i] < best_dist:
+                        best, best_dist = int(members[i]), float(dists[i])
+            if best >= 0 and best_dist <= ring * cell_size:
+                break
+        return best, best_dist
+
+    def node(self, index: int) -> Tuple[float, float]:
+        return tuple(self.node_coords[index].tolist())
+
+    def snap(self, node: Tuple, geographic: bool = False) -> int:
+        """Node index for a UTM point, or for a (lon, lat) point/node key when geographic is set"""
+        if geographic:
+            node = utm.from_latlon(node[1], node[0])[:2]
+        return self.find_nearest_node(node)[0]
+
+    def calculate_shortest_safest_path(
+        self, start_node: Tuple, end_node: Tuple, weight: str = "weight", geographic: bool = False
+    ) -> Tuple[List, float]:
+        """Same route and length in km as Network.calculate_shortest_safest_path, computed on the shared arrays"""
+        source = self.snap(start_node, geographic)
+        target = self.snap(end_node, geographic)
+        _, predecessors = dijkstra(self.matrix(weight), indices=source, return_predecessors=True)
+        if source != target and predecessors[target] < 0:
+            return [], 0
+
+        path = [target]
+        while path[-1] != source:
+            path.append(int(predecessors[path[-1]]))
+        path.reverse()
+
+        total_length = 0.0
+        for u, v in zip(path, path[1:]):
+            row = slice(self.indptr[u], self.indptr[u + 1])
+            total_length += float(self.edge_distance[row][self.indices[row] == v].min()) / 1000
+        return [self.node(i) for i in path], total_length
+
+    def available_parking(self, dropoff: bool = True) -> np.ndarray:
+        """Indices into the parking table, skipping full stations for a dropoff, empty ones for a pickup and
+        stations that are not installed"""
+        if dropoff:
+            counts, flags = self.parking_num_docks_available, self.parking_is_returning
+        else:
+            counts, flags = self.parking_num_bikes_available, self.parking_is_renting
+        return np.flatnonzero((counts != 0) & (flags != 0) & (self.parking_is_installed != 0))
+
+
+def _demo_worker(name: str) -> Tuple[int, float]:
+    shared = SharedGraph.attach(name)
+    # Copy the endpoints: views into the shared block would keep it from being closed
+    start = tuple(shared.node_utm[0].tolist())
+    end = tuple(shared.node_utm[len(shared.node_utm) // 2].tolist())
+    path, total_length = shared.calculate_shortest_safest_path(start, end)
+    shared.close()
+    return len(path), total_length
+
+
+if __name__ == "__main__":
+    from multiprocessing import get_context
+
+    from Network import read_graph
+    from Parking import parse_parking_geojson
+
+    graph = read_graph()
+    shared = SharedGraph.publish(graph, [node for node in parse_parking_geojson() if node in graph])
+    print(f"Published {len(shared.node_coords)} nodes in {shared.nbytes / 1e6:.1f} MB as {shared.name}")
+    with get_context("spawn").Pool(4) as pool:
+        print(pool.map(_demo_worker, [shared.name] * 4))
+    shared.close()
@@ -0,0 +1,193 @@
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Set, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy.spatial import KDTree
+
+# Edge attributes that add up along a chain
+summed_attributes = ["distance", "weight", "safety", "walking_time", "cycling_time"]
+
+
+class ChainGeometry(NamedTuple):
+    utm_coord: np.ndarray  # (k + 1, 2) UTM coordinates of the chain nodes
+    distance: np.ndarray  # (k,) distance of every original edge along the chain
+
+
+def _is_chain_node(graph: nx.Graph, node: Tuple) -> bool:
+    """Degree-2 vertex whose two edges only trace curve geometry of the same kind of way"""
+    if graph.degree(node) != 2 or graph.has_edge(node, node):
+        return False
+    (_, _, first), (_, _, second) = graph.edges(node, data=True)
+    return first.get("category") == second.get("category") and first.get("surface") == second.get("surface")
+
+
+def _chain_attributes(graph: nx.Graph, nodes: List[Tuple]) -> Dict:
+    edges = [graph.edges[u, v] for u, v in zip(nodes, nodes[1:])]
+    attributes = {key: value for key, value in edges[0].items() if key not in summed_attributes}
+    for key in summed_attributes:
+        if all(key in edge for edge in edges):
+            attributes[key] = sum(edge[key] for edge in edges)
+    return attributes
+
+
+def _add_chain(graph: nx.Graph, contracted: nx.Graph, chains: Dict, nodes: List[Tuple]) -> None:
+    """Add a chain as one edge, splitting it where that would create a self-loop or a parallel edge"""
+    u, v = nodes[0], nodes[-1]
+    if u == v:
+        first, second = len(nodes) // 3, 2 * len(nodes) // 3
+        for piece in (nodes[:first + 1], nodes[first:second + 1], nodes[second:]):
+            _add_chain(graph, contracted, chains, piece)
+        return
+    if contracted.has_edge(u, v):
+        if len(nodes) == 2:
+            # A plain edge cannot be split, so the merged chain that took its place has to be
+            existing = chains.pop((u, v), None) or chains.pop((v, u))
+            contracted.remove_edge(u, v)
+            _add_chain(graph, contracted, chains, nodes)
+            _add_chain(graph, contracted, chains, existing)
+            return
+        middle = len(nodes) // 2
+        _add_chain(graph, contracted, chains, nodes[:middle + 1])
+        _add_chain(graph, contracted, chains, nodes[middle:])
+        return
+
+    for node in (u, v):
+        if node not in contracted:
+            contracted.add_node(node, **graph.nodes[node])
+    contracted.add_edge(u, v, **_chain_attributes(graph, nodes))
+    if len(nodes) > 2:
+        chains[(u, v)] = nodes
+
+
+def contract_degree2_chains(graph: nx.Graph, keep: Iterable[Tuple] = ()) -> nx.Graph:
+    """Return a copy of the graph with degree-2 chains of equal category and surface merged into single edges.
+
+    Distances, weights and times are summed. The full node sequence of every merged edge is kept in
+    graph.graph["chains"] (see expand_path), its UTM coordinates and per-edge distances in
+    graph.graph["chain_geometry"] (see edge_geometry) and the chain and position of every former vertex
+    inside a chain in graph.graph["chain_nodes"]. Nodes in keep are never contracted, e.g. snapped POIs.
+    The node reduction is reported in graph.graph["contraction"].
+    """
+    keep = set(keep)
+    junctions: Set[Tuple] = {node for node in graph if node in keep or not _is_chain_node(graph, node)}
+    contracted = nx.Graph()
+    contracted.graph.update(
+        {key: value for key, value in graph.graph.items() if key not in ("kdTree", "segmentIndex")}
+    )
+    chains: Dict[Tuple, List[Tuple]] = {}
+    visited: Set[frozenset] = set()
+
+    def walk_from(start: Tuple) -> None:
+        for neighbor in graph[start]:
+            # Self-loops never shorten a route
+            if neighbor == start or frozenset((start, neighbor)) in visited:
+                continue
+            nodes = [start]
+            previous, current = start, neighbor
+            while current not in junctions:
+                nodes.append(current)
+                previous, current = current, next(n for n in graph[current] if n != previous)
+            nodes.append(current)
+            visited.update(frozenset(edge) for edge in zip(nodes, nodes[1:]))
+            _add_chain(graph, contracted, chains, nodes)
+
+    for node in list(junctions):
+        if node not in contracted:
+            contracted.add_node(node, **graph.nodes[node])
+        walk_from(node)
+
+    # Components that are a pure cycle have no junction, pin one of their nodes
+    for node in graph:
+        if node not in contracted and all(frozenset((node, n)) not in visited for n in graph[node]):
+            junctions.add(node)
+            contracted.add_node(node, **graph.nodes[node])
+            walk_from(node)
+
+    contracted.graph["chains"] = chains
+    # Former vertices inside a chain, so their keys can still be snapped onto the merged edge
+    contracted.graph["chain_nodes"] = {
+        node: (key, position) for key, nodes in chains.items() for position, node in enumerate(nodes[1:-1], 1)
+    }
+    contracted.graph["chain_geometry"] = {
+        key: ChainGeometry(
+            np.array([graph.nodes[node]["utm_coord"] for node in nodes], dtype=np.float64),
+            np.array([graph.edges[a, b]["distance"] for a, b in zip(nodes, nodes[1:])], dtype=np.float64),
+        )
+        for key, nodes in chains.items()
+    }
+    contracted.graph["contraction"] = {
+        "nodes_before": graph.number_of_nodes(),
+        "nodes_after": contracted.number_of_nodes(),
+        "edges_before": graph.number_of_edges(),
+        "edges_after": contracted.number_of_edges(),
+    }
+    if "kdTree" in graph.graph:
+        coords = [data["utm_coord"] for _, data in contracted.nodes(data=True)]
+        contracted.graph["kdTree"] = KDTree(coords)
+    return contracted
+
+
+def expand_path(graph: nx.Graph, path: List[Tuple]) -> List[Tuple]:
+    """Turn a path over a contracted graph back into the full node sequence of the original graph"""
+    chains = graph.graph.get("chains", {})
+    expanded = path[:1]
+    for u, v in zip(path, path[1:]):
+        if (u, v) in chains:
+            expanded.extend(chains[(u, v)][1:])
+        elif (v, u) in chains:
+            expanded.extend(chains[(v, u)][-2::-1])
+        else:
+            expanded.append(v)
+    return expanded
+
+
+def edge_geometry(graph: nx.Graph, u: Tuple, v: Tuple) -> Tuple[List[Tuple], np.ndarray, np.ndarray]:
+    """Nodes, UTM coordinates and per-piece distances of the edge from u to v, following a merged chain"""
+    chains = graph.graph.get("chains", {})
+    if (u, v) in chains:
+        geometry = graph.graph["chain_geometry"][(u, v)]
+        return chains[(u, v)], geometry.utm_coord, geometry.distance
+    if (v, u) in chains:
+        geometry = graph.graph["chain_geometry"][(v, u)]
+        return chains[(v, u)][::-1], geometry.utm_coord[::-1], geometry.distance[::-1]
+    utm_coord = np.array([graph.nodes[u]["utm_coord"], graph.nodes[v]["utm_coord"]], dtype=np.float64)
+    return [u, v], utm_coord, np.array([graph.edges[u, v]["distance"]], dtype=np.float64)
+
+
+def expand_edges(graph: nx.Graph, path: Iterable[Tuple]) -> Iterator[Tuple[Tuple, Tuple, Dict]]:
+    """Original edges along a route over a contracted graph, as (u, v, attributes).
+
+    The summed attributes of a merged edge are split over its pieces by distance; category and surface
+    are the same along a chain. The path may already be expanded: nodes that are not in the contracted
+    graph, such as the interior nodes of a chain, are skipped.
+    """
+    chains = graph.graph.get("chains", {})
+    path = iter(path)
+    previous = next(path, None)
+    for node in path:
+        if chains and node not in graph:
+            continue
+        edge_data = graph[previous][node]
+        if (previous, node) not in chains and (node, previous) not in chains:
+            yield previous, node, edge_data
+        else:
+            nodes, _, distances = edge_geometry(graph, previous, node)
+            total = distances.sum()
+            shares = distances / total if total > 0 else np.full(len(distances), 1 / len(distances))
+            for a, b, distance, share in zip(nodes, nodes[1:], distances.tolist(), shares.tolist()):
+                piece = {key: value * share if key in summed_attributes else value for key, value in edge_data.items()}
+                piece["distance"] = distance
+                yield a, b, piece
+        previous = node
+
+
+if __name__ == "__main__":
+    from Network import read_graph
+
+    graph = read_graph(1)
+    contracted = contract_degree2_chains(graph)
+    report = contracted.graph["contraction"]
+    print(
+        "Nodes: {nodes_before} -> {nodes_after}, edges: {edges_before} -> {edges_after}".format(**report),
+        f"({1 - report['nodes_after'] / report['nodes_before']:.0%} fewer nodes)",
+    )
@@ -0,0 +1,58 @@
+import json
+import os
+import subprocess
+import sys
+
+# Modules that make up the headless routing core; worker processes import nothing else
+core_modules = [
+    "Distance", "Network", "Parking", "Pareto", "Alternatives", "Closures", "SharedGraph", "RouteOutput",
+    "SegmentIndex", "Simplify", "ParkingAnalysis", "ParkingAnalysis01",
+]
+
+# The visualization and geo stacks must only be imported lazily by the plotting code
+forbidden_modules = ["matplotlib", "geopandas", "contextily", "shapely", "pandas"]
+
+import_time_budget = 1.5  # seconds for a cold import of all core modules
+repeats = 3
+
+probe = """
+import json, sys, time
+start = time.perf_counter()
+for module in sys.argv[1:]:
+    __import__(module)
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "loaded": sorted(m for m in sys.modules if "." not in m)}))
+"""
+
+
+def measure_import(modules=core_modules):
+    """Import modules in a fresh interpreter and return (seconds, top-level modules loaded)"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-c", probe, *modules], cwd=script_dir, capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["elapsed"], set(report["loaded"])
+
+
+def check_import_budget(budget=import_time_budget, modules=core_modules):
+    """Return a list of violations of the import budget, empty if the routing core is within it"""
+    timings = []
+    for _ in range(repeats):
+        elapsed, loaded = measure_import(modules)
+        timings.append(elapsed)
+
+    violations = [f"{name} imported at module level" for name in forbidden_modules if name in loaded]
+    if min(timings) > budget:
+        violations.append(f"import took {min(timings):.3f} s, budget is {budget:.3f} s")
+    return violations
+
+
+if __name__ == "__main__":
+    budget = float(os.environ.get("IMPORT_TIME_BUDGET", import_time_budget))
+    elapsed, _ = measure_import()
+    print(f"Cold import of {', '.join(core_modules)}: {elapsed:.3f} s (budget {budget:.3f} s)")
+    violations = check_import_budget(budget)
+    for violation in violations:
+        print("Error:", violation)
+    sys.exit(1 if violations else 0)
@@ -0,0 +1,8 @@
+import os
+
+from import_benchmark import check_import_budget, import_time_budget
+
+
+def test_routing_core_within_import_budget():
+    budget = float(os.environ.get("IMPORT_TIME_BUDGET", import_time_budget))
+    assert check_import_budget(budget) == []